@@ -1,26 +1,33 @@
 import streamlit as st
+import hashlib
+import logging
 import os
+import re
 import tempfile
+import threading
 import time
-import pandas as pd
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+import tiktoken
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
+from rank_bm25 import BM25Okapi
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
-from langchain_community.vectorstores import FAISS
 # from langchain.document_loaders import PyPDFLoader, UnstructuredWordDocumentLoader, TextLoader, CSVLoader, UnstructuredExcelLoader
 from langchain_community.document_loaders import (
     PyPDFLoader,
-    UnstructuredWordDocumentLoader,
+    UnstructuredPDFLoader,
     TextLoader,
     CSVLoader,
     UnstructuredExcelLoader,
 )
 from langchain.schema import Document
 
-import json
+import orjson
 
 st.set_page_config(
     page_title="Glean",
@@ -178,8 +185,16 @@ if 'selected_option' not in st.session_state:
     st.session_state.selected_option = None
 if 'documents_text' not in st.session_state:
     st.session_state.documents_text = []
-if 'documents_metadata' not in st.session_state:
-    st.session_state.documents_metadata = []
+if 'final_documents' not in st.session_state:
+    st.session_state.final_documents = []
+if 'inverted_index' not in st.session_state:
+    st.session_state.inverted_index = {}
+if 'chunk_tokens' not in st.session_state:
+    st.session_state.chunk_tokens = []
+if 'bm25' not in st.session_state:
+    st.session_state.bm25 = None
+if 'corpus_hash' not in st.session_state:
+    st.session_state.corpus_hash = None
 if 'processed_files' not in st.session_state:
     st.session_state.processed_files = []
 if 'chat_history' not in st.session_state:
@@ -187,6 +202,15 @@ if 'chat_history' not in st.session_state:
 
 # Load API keys from environment variables
 groq_api_key = os.getenv('GROQ_API_KEY')
+try:
+    max_upload_mb = int(os.getenv('MAX_UPLOAD_MB', '100'))
+except ValueError:
+    max_upload_mb = 100
+if max_upload_mb <= 0:
+    max_upload_mb = 100
+# Streamlit rejects anything above server.maxUploadSize before the script sees it
+max_upload_mb = min(max_upload_mb, st.get_option("server.maxUploadSize"))
+max_upload_bytes = max_upload_mb * 1024 * 1024
 os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
 
@@ -280,20 +304,46 @@ Provide a clear, concise answer based strictly on the document context.
 )
 
 # --------------------------- DOCUMENT PROCESSOR ---------------------------
+WORD_RE = re.compile(r"\w+")
+# PDFs yielding less than MIN_TEXT_DENSITY of EXPECTED_CHARS_PER_PAGE are re-parsed with OCR
+EXPECTED_CHARS_PER_PAGE = 500
+MIN_TEXT_DENSITY = 0.2
+
+logger = logging.getLogger(__name__)
+
 def process_uploaded_file(uploaded_file):
+    """Load an uploaded file into documents. Returns (documents, warning), where warning
+    describes a problem the user should know about even though the file loaded."""
     file_name = uploaded_file.name
     file_extension = file_name.split('.')[-1].lower()
 
+    # Reject oversized uploads before spending disk and parse time on them; the memory
+    # limit itself is Streamlit's server.maxUploadSize in .streamlit/config.toml
+    if uploaded_file.size > max_upload_bytes:
+        raise ValueError(f"File is too large (limit {max_upload_mb} MB)")
+
     # Create a temporary file to store the uploaded file
     with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}') as tmp_file:
         tmp_file.write(uploaded_file.getvalue())
         tmp_path = tmp_file.name
 
     # Process different file types
+    warning = None
     try:
         if file_extension == 'pdf':
             loader = PyPDFLoader(tmp_path)
             documents = loader.load()
+            # Text-native PDFs parse fine with PyPDF; only escalate to the much slower
+            # OCR-capable parser when the extracted text is too sparse (likely scanned)
+            extracted_chars = sum(len(doc.page_content.strip()) for doc in documents)
+            if extracted_chars / max(1, len(documents) * EXPECTED_CHARS_PER_PAGE) < MIN_TEXT_DENSITY:
+                try:
+                    documents = UnstructuredPDFLoader(tmp_path, strategy="hi_res").load()
+                except Exception as e:
+                    # OCR needs poppler and tesseract on the system (see packages.txt);
+                    # without them keep the sparse PyPDF text rather than failing the upload
+                    logger.exception("OCR fallback failed for %s", file_name)
+                    warning = f"looks scanned, but OCR was unavailable ({e}); using the sparse text PyPDF could extract"
         elif file_extension == 'txt':
             loader = TextLoader(tmp_path)
             documents = loader.load()
@@ -305,51 +355,169 @@ def process_uploaded_file(uploaded_file):
             loader = UnstructuredExcelLoader(tmp_path)
             documents = loader.load()
         else:
-            st.error(f"Unsupported file type: {file_extension}")
-            return []
+            # Raised rather than reported with st.error, since this runs on a
+            # worker thread without a Streamlit script context
+            raise ValueError(f"Unsupported file type: {file_extension}")
     finally:
         # Clean up the temporary file
         os.unlink(tmp_path)
 
-    return documents
+    return documents, warning
+
+@st.cache_resource
+def get_text_splitter():
+    """Build the text splitter once per server process instead of on every ingest"""
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+
+@st.cache_resource
+def get_token_encoder():
+    """Load the BPE encoding used to count chunk tokens once per server process.
+    The first load downloads the encoding file, so it can fail offline."""
+    return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text, token_encoder):
+    """Exact token count, or a rough estimate (1 token ≈ 4 characters) without an encoder"""
+    if token_encoder is None:
+        return len(text) // 4
+    return len(token_encoder.encode_ordinary(text))
 
 def vector_embedding(documents):
     with st.spinner("Processing documents..."):
-        st.session_state.text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        st.session_state.final_documents = st.session_state.text_splitter.split_documents(documents)
-        # Store documents in session state for simple text search
-        st.session_state.documents_text = [doc.page_content for doc in st.session_state.final_documents]
-        st.session_state.documents_metadata = [doc.metadata for doc in st.session_state.final_documents]
+        text_splitter = get_text_splitter()
+        try:
+            token_encoder = get_token_encoder()
+        except Exception:
+            # Failures aren't cached by st.cache_resource, so the next ingest retries the download
+            token_encoder = None
+        documents_text = []
+        final_documents = []
+        chunk_tokens = []
+        tokenized_chunks = []
+        inverted_index = defaultdict(list)
+        corpus_hasher = hashlib.blake2b()
+        # Split, tokenize, index and hash each chunk in a single pass over the loaded documents
+        for doc in documents:
+            for chunk in text_splitter.split_text(doc.page_content):
+                chunk_id = len(documents_text)
+                tokens = WORD_RE.findall(chunk.lower())
+                documents_text.append(chunk)
+                final_documents.append(Document(page_content=chunk, metadata=doc.metadata))
+                chunk_tokens.append(count_tokens(chunk, token_encoder))
+                tokenized_chunks.append(tokens)
+                for token in set(tokens):
+                    inverted_index[token].append(chunk_id)
+                corpus_hasher.update(chunk.encode())
+                corpus_hasher.update(b"\0")
+        # Store chunks, the token -> chunk ids index and BM25 statistics for simple text search
+        st.session_state.documents_text = documents_text
+        # Chain inputs are built once here and sliced per request instead of rebuilt every turn
+        st.session_state.final_documents = final_documents
+        st.session_state.chunk_tokens = chunk_tokens
+        st.session_state.inverted_index = {
+            token: np.array(chunk_ids, dtype=np.int32) for token, chunk_ids in inverted_index.items()
+        }
+        # BM25Okapi divides by the average chunk length, so it needs at least one token
+        st.session_state.bm25 = BM25Okapi(tokenized_chunks) if any(tokenized_chunks) else None
+        # Identifies the corpus for the extraction / summary result cache
+        st.session_state.corpus_hash = corpus_hasher.hexdigest()
     st.success("Documents processed successfully!")
 
-def estimate_tokens(text):
-    """Rough estimate of token count (1 token ≈ 4 characters)"""
-    return len(text) // 4
-
-def simple_text_search(query, documents_text, top_k=5):
-    """Simple text-based search using keyword matching"""
-    query_lower = query.lower()
-    results = []
-    
-    # If no query or empty documents, return all documents
-    if not query or not documents_text:
-        return documents_text[:top_k]
-    
-    for i, doc_text in enumerate(documents_text):
-        doc_lower = doc_text.lower()
-        # Simple keyword matching
-        score = sum(1 for word in query_lower.split() if word in doc_lower)
-        if score > 0:
-            results.append((score, doc_text, i))
+# --------------------------- RESULT CACHE ---------------------------
+RESULT_CACHE_SIZE = 32
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide LRU of extraction / summary results keyed by (corpus hash, task)"""
+    return OrderedDict(), threading.Lock()
+
+def get_cached_result(key):
+    cache, lock = get_result_cache()
+    with lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+def store_cached_result(key, result):
+    cache, lock = get_result_cache()
+    with lock:
+        cache[key] = result
+        cache.move_to_end(key)
+        while len(cache) > RESULT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def drop_cached_result(key):
+    cache, lock = get_result_cache()
+    with lock:
+        cache.pop(key, None)
+
+def format_timings(timings):
+    """Render per-stage wall-clock timings (in ms) as a single caption line"""
+    return "⏱️ " + " · ".join(f"{stage}: {ms:.0f} ms" for stage, ms in timings.items())
+
+# Context tokens per extraction call, leaving room in the 8k window for the prompt and response
+EXTRACTION_TOKEN_BUDGET = 6000
+# Parts sent to Groq at the same time, kept low to stay under its rate limits
+EXTRACTION_MAX_CONCURRENCY = 2
+
+def partition_chunks(chunk_tokens, budget):
+    """Split chunk indices into consecutive groups whose token counts fit in budget.
+    A chunk larger than the budget gets a group of its own."""
+    groups = []
+    current = []
+    total = 0
+    for i, tokens in enumerate(chunk_tokens):
+        if current and total + tokens > budget:
+            groups.append(current)
+            current = []
+            total = 0
+        current.append(i)
+        total += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def simple_text_search(query, documents_text, inverted_index, bm25, top_k=5):
+    """BM25 search over the chunks, scoring only those found in the precomputed inverted index.
+    Returns the indices of the top_k chunks."""
+    # If no query, empty documents or nothing to rank, return the first documents
+    if not query or not documents_text or bm25 is None:
+        return list(range(min(top_k, len(documents_text))))
     
-    # Sort by score and return top_k results
-    results.sort(key=lambda x: x[0], reverse=True)
+    query_tokens = list(set(WORD_RE.findall(query.lower())))
+    # Only chunks containing at least one query token need scoring
+    postings = [inverted_index[token] for token in query_tokens if token in inverted_index]
     
     # If no matches found, return first few documents
-    if not results:
-        return documents_text[:top_k]
+    if not postings:
+        return list(range(min(top_k, len(documents_text))))
     
-    return [doc_text for score, doc_text, idx in results[:top_k]]
+    candidates = np.unique(np.concatenate(postings))
+    scores = np.asarray(bm25.get_batch_scores(query_tokens, candidates))
+    # Partial selection of the top_k, then sort just those by score
+    if len(candidates) > top_k:
+        top = np.argpartition(-scores, top_k)[:top_k]
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.argsort(-scores[top])]
+    return [int(candidates[i]) for i in top]
+
+# Section headings in the extraction output, e.g. "SLA CLAUSES" -> "sla_clauses"
+SECTION_KEYS = {
+    key.replace('_', ' ').upper(): key
+    for key in (
+        "entities_and_contacts",
+        "contract_timeline",
+        "scope",
+        "sla_clauses",
+        "penalty_clauses",
+        "confidentiality",
+        "renewal_termination",
+        "commercial_terms",
+        "risks_assumptions",
+    )
+}
+SECTION_RE = re.compile("(" + "|".join(map(re.escape, SECTION_KEYS)) + ")", re.IGNORECASE)
 
 def convert_to_json(extraction_text):
     """Convert the extracted text into a structured JSON format"""
@@ -372,8 +540,9 @@ def convert_to_json(extraction_text):
         if not line:
             continue
             
-        if any(key.replace('_', ' ').upper() in line.upper() for key in sections.keys()):
-            current_section = next(key for key in sections.keys() if key.replace('_', ' ').upper() in line.upper())
+        heading = SECTION_RE.search(line)
+        if heading:
+            current_section = SECTION_KEYS[heading.group(1).upper()]
             continue
             
         if current_section and line:
@@ -389,8 +558,46 @@ def convert_to_json(extraction_text):
     
     return sections
 
+def is_not_available(value):
+    """True for values with no content: empty, markdown-only (e.g. "**"), or the "N/A"
+    placeholder the prompt asks for when nothing was found (e.g. "- **N/A**.")"""
+    return re.sub(r"[\W_]+", "", value).upper() in ("", "NA")
+
+def merge_extractions(extractions):
+    """Merge the convert_to_json output of several document parts section by section,
+    dropping "N/A" placeholders so they don't mix with values found in other parts"""
+    merged = convert_to_json("")
+    for extraction in extractions:
+        for section, value in extraction.items():
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    if is_not_available(item):
+                        continue
+                    existing = merged[section].get(key)
+                    if existing is None:
+                        merged[section][key] = item
+                    elif item not in existing.split("; "):
+                        merged[section][key] = f"{existing}; {item}"
+            elif isinstance(value, list):
+                merged[section].extend(
+                    item for item in value if not is_not_available(item) and item not in merged[section]
+                )
+            elif not is_not_available(value) and value not in merged[section].split("\n"):
+                merged[section] = f"{merged[section]}\n{value}" if merged[section] else value
+    return merged
+
 # --------------------------- INITIALIZE LLM ---------------------------
-llm = ChatGroq(groq_api_key=groq_api_key, model_name="Llama3-8b-8192")
+@st.cache_resource
+def get_llm():
+    """Build the Groq client once per server process and share it across sessions and reruns"""
+    # One pooled keep-alive HTTP/2 client so calls reuse connections instead of new TLS handshakes
+    http_client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+    )
+    return ChatGroq(groq_api_key=groq_api_key, model_name="Llama3-8b-8192", http_client=http_client)
+
+llm = get_llm()
 
 # --------------------------- MAIN APP LAYOUT ---------------------------
 st.markdown("## 👋 Hello! What do you want to know today?")
@@ -408,8 +615,18 @@ if uploaded_files:
         st.write("New files to process:", new_files)
         if st.button("🚀 Process Documents", use_container_width=True):
             all_documents = []
-            for uploaded_file in uploaded_files:
-                documents = process_uploaded_file(uploaded_file)
+            # Parse files in parallel; the loaders are blocking I/O + parsing calls
+            with ThreadPoolExecutor(max_workers=min(32, len(uploaded_files))) as executor:
+                futures = [executor.submit(process_uploaded_file, f) for f in uploaded_files]
+            # A file that fails to parse is reported on its own without discarding the others
+            for uploaded_file, future in zip(uploaded_files, futures):
+                try:
+                    documents, warning = future.result()
+                except Exception as e:
+                    st.error(f"{uploaded_file.name}: {e}")
+                    continue
+                if warning:
+                    st.warning(f"{uploaded_file.name}: {warning}")
                 all_documents.extend(documents)
             if all_documents:
                 vector_embedding(all_documents)
@@ -438,35 +655,30 @@ if st.session_state.documents_text:
 
     # --------------------------- MAIN FUNCTIONALITY ---------------------------
     if st.session_state.selected_option == 'extraction':
-        if "extraction_result" not in st.session_state:
+        # Reuse the extraction for identical documents instead of calling the LLM again
+        extraction_key = (st.session_state.corpus_hash, 'extraction')
+        extraction_result = get_cached_result(extraction_key)
+        # Incomplete results are kept for this session only, so page reruns don't re-extract
+        partial_extraction = st.session_state.get('partial_extraction')
+        if extraction_result is None and partial_extraction and partial_extraction[0] == extraction_key:
+            extraction_result = partial_extraction[1]
+        if extraction_result is None:
             with st.spinner("Extracting key details..."):
+                start = time.perf_counter()
                 # Use all documents for extraction instead of just searching
                 all_docs = st.session_state.documents_text
                 
                 # Debug: Show how many documents we have
                 st.info(f"Processing {len(all_docs)} document chunks for extraction...")
                 
-                # Limit the number of documents to avoid token limit issues
-                # Start with a conservative number and adjust based on token count
-                max_chunks = min(2, len(all_docs))
-                selected_docs = all_docs[:max_chunks]
-                
-                # Estimate tokens for the selected documents
-                total_text = " ".join(selected_docs)
-                estimated_tokens = estimate_tokens(total_text)
-                
-                st.info(f"Using first {max_chunks} chunks (estimated {estimated_tokens} tokens) to stay within API limits...")
+                # Split the chunks into parts that each fit the token budget to avoid token limit issues
+                groups = partition_chunks(st.session_state.chunk_tokens, EXTRACTION_TOKEN_BUDGET)
                 
-                # If still too large, reduce further
-                if estimated_tokens > 4000:  # Leave room for prompt and response
-                    max_chunks = 1
-                    selected_docs = all_docs[:max_chunks]
-                    total_text = " ".join(selected_docs)
-                    estimated_tokens = estimate_tokens(total_text)
-                    st.warning(f"Reduced to {max_chunks} chunk (estimated {estimated_tokens} tokens) to avoid token limit...")
+                st.info(f"Analysing in {len(groups)} part(s) of up to {EXTRACTION_TOKEN_BUDGET} tokens to stay within API limits...")
                 
-                # Create documents for the chain - use limited documents
-                documents = [Document(page_content=doc) for doc in selected_docs]
+                # Use the prebuilt documents for the chain, one list per part
+                group_documents = [[st.session_state.final_documents[i] for i in group] for group in groups]
+                documents = [doc for docs in group_documents for doc in docs]
                 
                 # Create a more direct prompt for extraction
                 direct_extraction_prompt = ChatPromptTemplate.from_template("""
@@ -492,40 +704,77 @@ if st.session_state.documents_text:
                 """)
                 
                 document_chain = create_stuff_documents_chain(llm, direct_extraction_prompt)
+                retrieval_done = time.perf_counter()
                 
-                start = time.process_time()
-                response = document_chain.invoke({'context': documents, 'input': 'Extract all key legal information from the document'})
-                elapsed = time.process_time() - start
-
-                # Handle response - it might be a string or a dictionary
-                if isinstance(response, dict):
-                    answer = response.get('answer', str(response))
+                if len(group_documents) == 1:
+                    # Stream the answer as it is generated; it is re-rendered below once complete
+                    live_output = st.empty()
+                    with live_output.container():
+                        st.subheader("📑 Legal Document Insights")
+                        answers = [st.write_stream(document_chain.stream({'context': documents, 'input': 'Extract all key legal information from the document'}))]
+                    live_output.empty()
+                    answer = answers[0]
+                    failed_parts = []
                 else:
-                    answer = str(response)
-
-                # Convert to JSON
-                json_data = convert_to_json(answer)
-
-                # Store the result in session state
-                st.session_state.extraction_result = {
+                    # Extract from the parts in parallel; a failed part must not discard the others
+                    results = document_chain.batch(
+                        [
+                            {'context': docs, 'input': 'Extract all key legal information from the document'}
+                            for docs in group_documents
+                        ],
+                        config={"max_concurrency": EXTRACTION_MAX_CONCURRENCY},
+                        return_exceptions=True,
+                    )
+                    answers = [result for result in results if not isinstance(result, Exception)]
+                    failed_parts = [
+                        (i + 1, str(result)) for i, result in enumerate(results) if isinstance(result, Exception)
+                    ]
+                    if not answers:
+                        st.error(f"Extraction failed for every part of the document: {failed_parts[0][1]}")
+                        st.stop()
+                    answer = "\n\n".join(
+                        f"### Part {i + 1}\n\n{result}"
+                        for i, result in enumerate(results) if not isinstance(result, Exception)
+                    )
+                llm_done = time.perf_counter()
+
+                # Convert to JSON, serialized once here rather than on every rerun of the page
+                json_data = merge_extractions(convert_to_json(part) for part in answers)
+                json_bytes = orjson.dumps(json_data, option=orjson.OPT_INDENT_2)
+                end = time.perf_counter()
+
+                # Store the result in the cache
+                extraction_result = {
                     "answer": answer,
                     "json_data": json_data,
-                    "elapsed": elapsed,
+                    "json_bytes": json_bytes,
+                    "elapsed": end - start,
+                    "timings": {
+                        "Retrieval": (retrieval_done - start) * 1000,
+                        "LLM": (llm_done - retrieval_done) * 1000,
+                        "Post-processing": (end - llm_done) * 1000,
+                    },
+                    "failed_parts": failed_parts,
                     "context": documents
                 }
-
-        # Retrieve from session state
-        extraction_result = st.session_state.extraction_result
+                # Only complete results go in the shared cache, so a transient failure isn't served to everyone
+                if failed_parts:
+                    st.session_state.partial_extraction = (extraction_key, extraction_result)
+                else:
+                    store_cached_result(extraction_key, extraction_result)
 
         st.success(f"Analysis completed in {extraction_result['elapsed']:.2f} seconds!")
+        st.caption(format_timings(extraction_result['timings']))
+        for part, error in extraction_result['failed_parts']:
+            st.warning(f"Part {part} could not be analysed and is missing from the results ({error}). Use 'Re-run Extraction' to retry.")
         
         # Add a note about the limitation
-        st.info("💡 **Note**: Due to API token limits, this analysis is based on the first few document chunks. For comprehensive analysis, use the 'Chat with Docs' feature to ask specific questions about different parts of your document.")
+        st.info("💡 **Note**: Due to API token limits, long documents are analysed in parts and the results are merged. For more detail on a specific part of your document, use the 'Chat with Docs' feature.")
         
         # Add a button to re-run extraction
         if st.button("🔄 Re-run Extraction"):
-            if "extraction_result" in st.session_state:
-                del st.session_state.extraction_result
+            drop_cached_result(extraction_key)
+            st.session_state.pop('partial_extraction', None)
             st.rerun()
         
         st.subheader("📑 Legal Document Insights")
@@ -536,7 +785,7 @@ if st.session_state.documents_text:
         with col1:
             st.download_button(
                 label="📥 Download JSON",
-                data=json.dumps(extraction_result['json_data'], indent=2),
+                data=extraction_result['json_bytes'],
                 file_name="legal_extraction.json",
                 mime="application/json"
             )
@@ -562,30 +811,36 @@ if st.session_state.documents_text:
             st.session_state.chat_history.append(f"User: {prompt1}")
             
             with st.spinner("Finding answer..."):
+                start = time.perf_counter()
                 # Use simple text search to get relevant documents
-                relevant_docs = simple_text_search(prompt1, st.session_state.documents_text)
+                relevant_ids = simple_text_search(
+                    prompt1,
+                    st.session_state.documents_text,
+                    st.session_state.inverted_index,
+                    st.session_state.bm25,
+                )
                 
-                # Create documents for the chain
-                documents = [Document(page_content=doc) for doc in relevant_docs]
+                # Pick the prebuilt documents for the chain
+                documents = [st.session_state.final_documents[i] for i in relevant_ids]
                 
                 document_chain = create_stuff_documents_chain(llm, qa_prompt)
+                retrieval_done = time.perf_counter()
                 
-                start = time.process_time()
-                response = document_chain.invoke({'context': documents, 'input': prompt1})
-                elapsed = time.process_time() - start
-                
-                # Handle response - it might be a string or a dictionary
-                if isinstance(response, dict):
-                    answer = response.get('answer', str(response))
-                else:
-                    answer = str(response)
+                status = st.empty()
+                st.subheader("💡 Answer")
+                # Stream the answer to the page as it is generated
+                answer = st.write_stream(document_chain.stream({'context': documents, 'input': prompt1}))
+                end = time.perf_counter()
                 
                 # Store AI response in chat history
                 st.session_state.chat_history.append(f"AI: {answer}")
                 
-                st.success(f"Answer found in {elapsed:.2f} seconds!")
-                st.subheader("💡 Answer")
-                st.write(answer)
+                with status.container():
+                    st.success(f"Answer found in {end - start:.2f} seconds!")
+                    st.caption(format_timings({
+                        "Retrieval": (retrieval_done - start) * 1000,
+                        "LLM": (end - retrieval_done) * 1000,
+                    }))
                 
                 with st.expander("📚 Relevant Document Sections"):
                     for i, doc in enumerate(documents):
@@ -606,11 +861,15 @@ if st.session_state.documents_text:
             st.write("No chat history available.")
     
     elif st.session_state.selected_option == 'summary':
-        if "summary" in st.session_state:  # Check if summary exists
+        # Reuse the summary for identical documents instead of calling the LLM again
+        summary_key = (st.session_state.corpus_hash, 'summary')
+        summary = get_cached_result(summary_key)
+        if summary is not None:  # Check if summary exists
             st.subheader("📄 Document Summary")
-            st.write(st.session_state["summary"])  # Display stored summary
+            st.write(summary)  # Display stored summary
         else:
             with st.spinner("Generating document summary..."):
+                start = time.perf_counter()
                 summary_prompt = ChatPromptTemplate.from_template("""
                 You are an expert document summarizer. Provide a comprehensive yet concise summary of the document.
 
@@ -629,33 +888,38 @@ if st.session_state.documents_text:
                 """)
 
                 # Use simple text search to get relevant documents
-                relevant_docs = simple_text_search("summary overview main points", st.session_state.documents_text)
+                relevant_ids = simple_text_search(
+                    "summary overview main points",
+                    st.session_state.documents_text,
+                    st.session_state.inverted_index,
+                    st.session_state.bm25,
+                )
                 
-                # Create documents for the chain
-                documents = [Document(page_content=doc) for doc in relevant_docs]
+                # Pick the prebuilt documents for the chain
+                documents = [st.session_state.final_documents[i] for i in relevant_ids]
                 
                 document_chain = create_stuff_documents_chain(llm, summary_prompt)
+                retrieval_done = time.perf_counter()
                 
-                start = time.process_time()
-                response = document_chain.invoke({'context': documents, 'input': 'Generate a comprehensive summary of the entire document'})
-                elapsed = time.process_time() - start
-
-                # Handle response - it might be a string or a dictionary
-                if isinstance(response, dict):
-                    summary = response.get('answer', str(response))
-                else:
-                    summary = str(response)
+                status = st.empty()
+                st.subheader("📄 Document Summary")
+                # Stream the summary to the page as it is generated
+                summary = st.write_stream(document_chain.stream({'context': documents, 'input': 'Generate a comprehensive summary of the entire document'}))
+                end = time.perf_counter()
 
-                st.session_state["summary"] = summary  # Store summary
+                store_cached_result(summary_key, summary)  # Store summary
 
-                st.success(f"Summary generated in {elapsed:.2f} seconds!")
-                st.subheader("📄 Document Summary")
-                st.write(st.session_state["summary"])  # Display stored summary
+                with status.container():
+                    st.success(f"Summary generated in {end - start:.2f} seconds!")
+                    st.caption(format_timings({
+                        "Retrieval": (retrieval_done - start) * 1000,
+                        "LLM": (end - retrieval_done) * 1000,
+                    }))
 
         # Optional: Add download button for summary
         st.download_button(
             label="📥 Download Summary",
-            data=st.session_state["summary"],
+            data=summary,
             file_name="document_summary.txt",
             mime="text/plain"
         )